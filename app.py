@@ -1,3 +1,4 @@
+import time
 import streamlit as st
 import pandas as pd
 import seaborn as sns
@@ -10,6 +11,7 @@ import get_data as gd
 import make_dataset as md
 sys.path.append('src/visualization')
 import plot as pl
+sys.path.append('src/models')
 import visualize as vz
 
 st.set_option('deprecation.showPyplotGlobalUse', False)
@@ -64,7 +66,23 @@ models_dict = {
 st.sidebar.header("Évaluation du modèle")
 select_info = st.sidebar.selectbox('Sélectionnez le donnée recherchée',
                                    ['RMSE / Nombre d\'arbres',
-                                    'Poids des variables'])
+                                    'Poids des variables',
+                                    'Dépendance partielle'])
+
+
+# Temps visé avant l'affichage des premiers graphiques, en secondes
+preview_target_seconds = float(gd.config.get("PREVIEW_TARGET_SECONDS") or 5.0)
+
+
+@st.cache_resource
+def progressive_models(model_name):
+    """
+    Entraîne un modèle d'aperçu sur un échantillon puis lance l'entraînement du modèle complet en
+    arrière-plan. Le résultat est conservé d'une exécution à l'autre de la page.
+    """
+    preview, sample_size = vz.get_preview_model(dataset_df, models_dict[model_name],
+                                                preview_target_seconds)
+    return preview, sample_size, vz.start_model(dataset_df, models_dict[model_name])
 
 
 # Page for Data Visualization
@@ -79,6 +97,7 @@ def data_visualization_page():
         sns.histplot(dataset_df[house_data], color='g', bins=100, kde=True, alpha=0.4)
         fig_data = plt.gcf()
         st.pyplot(fig_data)
+        plt.close(fig_data)
 
     # Select the model
     if select_model is not None:
@@ -132,10 +151,33 @@ def data_visualization_page():
     if select_info is not None:
         st.subheader("Résultats")
         st.write(select_info)
+        preview, sample_size, full_model = progressive_models(select_model)
+        is_preview = not full_model.done()
+        rf = preview if is_preview else full_model.result()
+        if is_preview:
+            st.info(f"Aperçu : modèle entraîné sur un échantillon de {sample_size} maisons avec \
+                moins d'arbres. Les résultats définitifs s'afficheront dès que le modèle complet \
+                sera entraîné.")
+        fig = None
         if select_info == 'RMSE / Nombre d\'arbres':
-            st.pyplot(vz.evaluate_logs(dataset_df, models_dict[select_model]))
+            fig = vz.evaluate_logs(dataset_df, models_dict[select_model], rf)
         elif select_info == 'Poids des variables':
-            st.pyplot(vz.plot_inspector(dataset_df, models_dict[select_model]))
+            fig = vz.plot_inspector(dataset_df, models_dict[select_model], rf)
+        elif select_info == 'Dépendance partielle':
+            if house_data == 'SalePrice':
+                st.write("Sélectionnez une feature autre que le prix de vente.")
+            else:
+                st.write(f"Évolution du prix prédit lorsque seule la feature {house_data} varie.")
+                fig = vz.plot_partial_dependence(dataset_df, models_dict[select_model],
+                                                 house_data, rf)
+        if fig is not None:
+            st.pyplot(fig)
+            # Ferme la figure, la page étant relancée tant que le modèle complet n'est pas prêt.
+            plt.close(fig)
+        if is_preview:
+            # Relance la page jusqu'à ce que le modèle complet soit prêt.
+            time.sleep(1)
+            st.rerun()
 
 
 def main():
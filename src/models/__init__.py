@@ -1,2 +1,8 @@
 from .train_model import train_model, load_data as load_training_data, save_model
 from .predict_model import load_model, make_predictions, load_data as load_prediction_data
+from .partial_dependence import partial_dependence, make_grid as make_partial_dependence_grid
+from .explain_model import compile_forest, tree_shap, save_contributions
+from .drift_monitor import DriftMonitor, DataProfile, QuantileSketch, FrequencySketch
+from .distributed_train import train_distributed, shard_dataset
+from .compact_model import compact_model, optimal_num_trees
+from .prediction_cache import PredictionCache, model_version
@@ -0,0 +1,183 @@
+"""
+This module compacts a trained TensorFlow Decision Forests model. The RMSE curve of the training
+logs (the one plotted by `plot.evaluate_model`) usually plateaus long before the final number of
+trees: the model is truncated to the smallest number of trees whose RMSE is within a tolerance
+of the best one, the splits with a low gain whose children are both leaves are pruned, and the
+result is saved as a new model version along with a report of the RMSE delta and of the size and
+latency savings. The drift baseline of the model, if any, is copied to the new version.
+
+Imports:
+    os: Used to measure the size of the saved models.
+    shutil: Used to copy the drift baseline to the new model version.
+    json: Used to save the compaction report.
+    time: Used to measure the prediction latency.
+    logging: Used for tracking events that happen when the software runs.
+    pathlib.Path: Used for manipulating filesystem paths in an object-oriented way.
+    numpy (np): Provides the RMSE computation.
+    tf_keras: Loads the saved models.
+    tensorflow_decision_forests (tfdf): Provides the model inspector, the tree structure and the
+    model builders.
+    drift_monitor.BASELINE_FILE: The drift baseline saved with the model by `train_model`.
+"""
+import os
+import shutil
+import json
+import time
+import logging
+from pathlib import Path
+import numpy as np
+import tf_keras
+import tensorflow_decision_forests as tfdf
+try:
+    from .drift_monitor import BASELINE_FILE
+except ImportError:
+    # Run as a script from src/models.
+    from drift_monitor import BASELINE_FILE
+
+
+REPORT_FILE = "compaction_report.json"
+
+
+def optimal_num_trees(logs, tolerance=0.01):
+    """
+    Find the smallest number of trees whose RMSE is within `tolerance` (relative) of the best RMSE
+    of the training logs.
+
+    Parameters:
+        logs (list): The training logs of the model (`inspector.training_logs()`).
+        tolerance (float, optional): The relative RMSE increase accepted. Defaults to 1%.
+
+    Returns:
+        tuple: The number of trees, its RMSE and the best RMSE.
+    """
+    logs = [log for log in logs if log.evaluation is not None and log.evaluation.rmse is not None]
+    if not logs:
+        raise ValueError("The training logs do not contain any RMSE evaluation.")
+    best_rmse = min(log.evaluation.rmse for log in logs)
+    selected = min((log for log in logs if log.evaluation.rmse <= best_rmse * (1 + tolerance)),
+                   key=lambda log: log.num_trees)
+    return selected.num_trees, selected.evaluation.rmse, best_rmse
+
+
+def _count_nodes(node):
+    if isinstance(node, tfdf.py_tree.node.LeafNode):
+        return 1
+    return 1 + _count_nodes(node.pos_child) + _count_nodes(node.neg_child)
+
+
+def prune_tree(node, min_split_score):
+    """
+    Replace, bottom-up, the splits whose score is below `min_split_score` and whose children are
+    both leaves by a single leaf holding the weighted average of their values.
+    """
+    if isinstance(node, tfdf.py_tree.node.LeafNode):
+        return node
+    node.pos_child = prune_tree(node.pos_child, min_split_score)
+    node.neg_child = prune_tree(node.neg_child, min_split_score)
+    score = getattr(node.condition, "split_score", None)
+    leaves = (node.pos_child, node.neg_child)
+    if score is None or score >= min_split_score or not all(
+            isinstance(leaf, tfdf.py_tree.node.LeafNode) for leaf in leaves):
+        return node
+    weights = [getattr(leaf.value, "num_examples", None) or 1.0 for leaf in leaves]
+    value = np.average([leaf.value.value for leaf in leaves], weights=weights)
+    return tfdf.py_tree.node.LeafNode(
+        tfdf.py_tree.value.RegressionValue(value=float(value), num_examples=float(sum(weights))))
+
+
+def _directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(path) for name in names)
+
+
+def _predict(model, data, batch_size=8192):
+    dataset = tfdf.keras.pd_dataframe_to_tf_dataset(data, task=tfdf.keras.Task.REGRESSION,
+                                                    batch_size=batch_size)
+    return np.asarray(model.predict(dataset, verbose=0)).reshape(-1)
+
+
+def _latency(model, data, repeats=3):
+    """
+    Best prediction time of the data, in seconds, after a warm-up call.
+    """
+    _predict(model, data.iloc[:1])
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        _predict(model, data)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def compact_model(model_path, validation_data, output_path=None, tolerance=0.01,
+                  min_split_score=0.0, label="SalePrice"):
+    """
+    Truncate and prune a saved model and save the result as a new model version, with the drift
+    baseline of the model so that its predictions are still monitored by `predict_model`.
+
+    Parameters:
+        model_path (str): Path to the saved model.
+        validation_data (DataFrame): Data (with the label) used to measure the RMSE of both models
+        and their prediction latency.
+        output_path (str, optional): Path of the new model version. Defaults to `model_path`
+        suffixed with '_compact'.
+        tolerance (float, optional): The relative RMSE increase accepted when truncating.
+        min_split_score (float, optional): The split score below which the splits whose children
+        are both leaves are pruned. Defaults to 0 (no pruning).
+        label (str, optional): The label column of `validation_data`. Defaults to 'SalePrice'.
+
+    Returns:
+        dict: The compaction report, also saved in the new model directory.
+    """
+    output_path = output_path or f"{model_path}_compact"
+    model = tf_keras.models.load_model(model_path)
+    # A model loaded with tf_keras has no inspector: the trees are read from the saved model.
+    inspector = tfdf.inspector.make_inspector(os.path.join(model_path, "assets"))
+    num_trees, rmse, best_rmse = optimal_num_trees(inspector.training_logs(), tolerance)
+
+    objective = tfdf.py_tree.objective.RegressionObjective(label=inspector.label().name)
+    # The dataspec keeps the inputs (and categorical dictionaries) of the model, including the
+    # features no longer used by the remaining trees.
+    if inspector.model_type() == "GRADIENT_BOOSTED_TREES":
+        bias = float(inspector.specialized_header().initial_predictions[0])
+        builder = tfdf.builder.GradientBoostedTreeBuilder(path=str(output_path),
+                                                          objective=objective, bias=bias,
+                                                          import_dataspec=inspector.dataspec)
+    else:
+        builder = tfdf.builder.RandomForestBuilder(path=str(output_path), objective=objective,
+                                                   import_dataspec=inspector.dataspec)
+
+    nodes_before, nodes_after = 0, 0
+    for tree_idx in range(inspector.num_trees()):
+        tree = inspector.extract_tree(tree_idx)
+        nodes_before += _count_nodes(tree.root)
+        if tree_idx >= num_trees:
+            continue
+        tree = tfdf.py_tree.tree.Tree(prune_tree(tree.root, min_split_score))
+        nodes_after += _count_nodes(tree.root)
+        builder.add_tree(tree)
+    builder.close()
+    if (Path(model_path) / BASELINE_FILE).exists():
+        shutil.copy2(Path(model_path) / BASELINE_FILE, Path(output_path) / BASELINE_FILE)
+    logging.info("Model compacted from %d to %d trees (%d to %d nodes).",
+                 inspector.num_trees(), num_trees, nodes_before, nodes_after)
+
+    report = {
+        "source": str(model_path),
+        "num_trees": [inspector.num_trees(), num_trees],
+        "num_nodes": [nodes_before, nodes_after],
+        "size_bytes": [_directory_size(model_path), _directory_size(output_path)],
+        "log_rmse": {"best": best_rmse, "selected": rmse, "delta": rmse - best_rmse},
+    }
+    compact = tf_keras.models.load_model(output_path)
+    features = validation_data.drop(label, axis=1)
+    rmses = [float(np.sqrt(np.mean((_predict(m, features) - validation_data[label]) ** 2)))
+             for m in (model, compact)]
+    report["validation_rmse"] = {"before": rmses[0], "after": rmses[1],
+                                 "delta": rmses[1] - rmses[0]}
+    report["latency_seconds"] = [_latency(model, features), _latency(compact, features)]
+
+    with open(Path(output_path) / REPORT_FILE, mode='w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2)
+    logging.info("Compacted model saved to %s: %s", output_path, report)
+    return report
@@ -0,0 +1,326 @@
+"""
+This module trains a Gradient Boosted Trees model on several worker processes with the
+distributed API of TensorFlow Decision Forests (`DistributedGradientBoostedTreesModel` under a
+`ParameterServerStrategy`). The processed dataset is sharded into CSV files read directly by the
+workers, the worker servers are launched (by default all on localhost) and supervised by the
+coordinator, which restarts the workers that fail and reports the work of each worker: the CPU
+time measured on each local worker process, and a throughput estimated from the rows of the
+shards assigned to it.
+
+Imports:
+    os: Used to create the working directories.
+    sys: Used to launch the worker servers with the current Python interpreter.
+    json: Used to pass the cluster description to the worker servers.
+    time: Used to measure the training time.
+    socket: Used to find free ports for the servers.
+    contextlib: Used to hold the ports until they are all chosen, and to launch the local servers
+    only when no cluster is given.
+    logging: Used for tracking events that happen when the software runs.
+    tempfile: Used for the default working directory.
+    threading: Used to supervise the worker servers during the training.
+    subprocess: Used to launch the worker servers.
+    click: Used to create the command line interface.
+    pandas (pd): Provides data structures and data analysis tools.
+    tensorflow (tf): Provides the servers and the distribution strategy.
+    tensorflow_decision_forests (tfdf): Provides the distributed model (and registers its ops
+    on the servers).
+"""
+import os
+import sys
+import json
+import time
+import socket
+import logging
+import tempfile
+import threading
+import subprocess
+import contextlib
+import click
+import pandas as pd
+import tensorflow as tf
+import tensorflow_decision_forests as tfdf
+
+
+def shard_dataset(data, output_dir, num_shards, prefix="train"):
+    """
+    Split a DataFrame into CSV shards following the `<prefix>-<i>-of-<n>` naming convention of
+    TensorFlow Decision Forests.
+
+    Returns:
+        tuple: The sharded path (`<output_dir>/<prefix>@<n>`) and the number of rows per shard.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    sizes = []
+    for i in range(num_shards):
+        shard = data.iloc[i::num_shards]
+        shard.to_csv(os.path.join(output_dir, f"{prefix}-{i:05d}-of-{num_shards:05d}"),
+                     index=False)
+        sizes.append(len(shard))
+    logging.info("Dataset split into %d shards in %s", num_shards, output_dir)
+    return os.path.join(output_dir, f"{prefix}@{num_shards}"), sizes
+
+
+def free_ports(count):
+    """
+    Return `count` distinct ports currently free on this host. The ports are all held until the
+    last one is chosen, so that the same port is never returned twice; another process may still
+    take one of them before the server binds it, the server then fails and is restarted.
+    """
+    with contextlib.ExitStack() as stack:
+        ports = []
+        for _ in range(count):
+            sock = stack.enter_context(socket.socket(socket.AF_INET, socket.SOCK_STREAM))
+            sock.bind(("", 0))
+            ports.append(sock.getsockname()[1])
+        return ports
+
+
+def local_cluster_spec(num_workers, host="localhost"):
+    """
+    Describe a cluster of `num_workers` workers and one parameter server on a single host. The
+    parameter server is required by the strategy but not used by the training.
+    """
+    *workers, ps = free_ports(num_workers + 1)
+    return {"worker": [f"{host}:{port}" for port in workers], "ps": [f"{host}:{ps}"]}
+
+
+def process_cpu_seconds(pid):
+    """
+    Return the CPU time (user and system) used so far by a process, read from /proc, or None
+    when it is not available (process exited, or not Linux).
+    """
+    try:
+        with open(f"/proc/{pid}/stat", encoding="utf-8") as file:
+            fields = file.read().rsplit(")", 1)[1].split()
+    except (OSError, IndexError):
+        return None
+    # utime and stime are the 14th and 15th fields, the 3rd being the first after the name.
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def run_server(cluster, job_name, task_index):
+    """
+    Run a TensorFlow server of the cluster until it is killed.
+    """
+    server = tf.distribute.Server(tf.train.ClusterSpec(cluster), job_name=job_name,
+                                  task_index=task_index, protocol="grpc", start=True)
+    server.join()
+
+
+class LocalCluster:
+    """
+    The worker and parameter servers of a cluster, launched as local processes and restarted
+    (on the same address) when they fail, at most `max_restarts` times each. A server failing
+    once more is not restarted and is added to `failures`. The CPU time of each server is sampled
+    at every poll and summed over its restarts.
+    """
+
+    def __init__(self, cluster, max_restarts=3, poll_interval=1.0):
+        self.cluster = cluster
+        self.max_restarts = max_restarts
+        self.poll_interval = poll_interval
+        self.processes = {}
+        self.failures = []
+        self.restarts = {(job, i): 0 for job, tasks in cluster.items() for i in range(len(tasks))}
+        self._cpu_exited = dict.fromkeys(self.restarts, 0.0)
+        self._cpu_current = dict.fromkeys(self.restarts, 0.0)
+        self._stop = threading.Event()
+        self._supervisor = threading.Thread(target=self._supervise, daemon=True)
+
+    def _launch(self, job_name, task_index):
+        command = [sys.executable, os.path.abspath(__file__), "server",
+                   "--cluster", json.dumps(self.cluster),
+                   "--job-name", job_name, "--task-index", str(task_index)]
+        self.processes[(job_name, task_index)] = subprocess.Popen(command)
+
+    def _sample_cpu(self, key):
+        process = self.processes.get(key)
+        cpu = process_cpu_seconds(process.pid) if process is not None else None
+        if cpu is not None:
+            self._cpu_current[key] = cpu
+
+    def cpu_seconds(self, job_name, task_index):
+        """
+        Return the CPU time used by a server, over all its restarts (up to the last poll for the
+        processes that were killed), or None if it could not be measured.
+        """
+        key = (job_name, task_index)
+        self._sample_cpu(key)
+        total = self._cpu_exited[key] + self._cpu_current[key]
+        return total if total > 0 else None
+
+    def _supervise(self):
+        while not self._stop.wait(self.poll_interval):
+            for (job_name, task_index), process in list(self.processes.items()):
+                key = (job_name, task_index)
+                if process.poll() is None:
+                    self._sample_cpu(key)
+                    continue
+                if self._stop.is_set():
+                    continue
+                self._cpu_exited[key] += self._cpu_current[key]
+                self._cpu_current[key] = 0.0
+                if self.restarts[(job_name, task_index)] >= self.max_restarts:
+                    logging.error("Server %s:%d failed too many times.", job_name, task_index)
+                    del self.processes[(job_name, task_index)]
+                    self.failures.append(key)
+                    continue
+                self.restarts[(job_name, task_index)] += 1
+                logging.warning("Server %s:%d exited with code %s, restarting it.",
+                                job_name, task_index, process.returncode)
+                self._launch(job_name, task_index)
+
+    def __enter__(self):
+        for job_name, tasks in self.cluster.items():
+            for task_index in range(len(tasks)):
+                self._launch(job_name, task_index)
+        self._supervisor.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._supervisor.join()
+        for key in self.processes:
+            self._sample_cpu(key)
+        for process in self.processes.values():
+            process.terminate()
+        for process in self.processes.values():
+            process.wait()
+
+
+def _fit_until_failure(fit, servers, poll_interval=1.0):
+    """
+    Run `fit` in a thread until it returns, or until a server of `servers` (a `LocalCluster`, or
+    None) has failed for good: the coordinator would otherwise wait for it forever. The thread of
+    an aborted training is left blocked on the dead server (it is a daemon thread).
+
+    Raises:
+        RuntimeError: If a server failed more than `max_restarts` times.
+    """
+    outcome = {}
+
+    def run():
+        try:
+            fit()
+        except Exception as error:  # pylint: disable=broad-except
+            outcome["error"] = error
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    while thread.is_alive():
+        thread.join(poll_interval)
+        if servers is not None and servers.failures:
+            failed = ", ".join(f"{job_name}:{task_index}" for job_name, task_index
+                               in servers.failures)
+            raise RuntimeError(f"Distributed training aborted: server {failed} failed more "
+                               f"than {servers.max_restarts} times.")
+    if "error" in outcome:
+        raise outcome["error"]
+
+
+def train_distributed(train_data, label="SalePrice", num_workers=2, cluster=None, work_dir=None,
+                      shards_per_worker=2, max_restarts=3, **hyperparameters):
+    """
+    Train a Gradient Boosted Trees model on several workers.
+
+    Parameters:
+        train_data (DataFrame): The processed training data, including the label column.
+        label (str, optional): The label column. Defaults to 'SalePrice'.
+        num_workers (int, optional): The number of local workers to launch. Defaults to 2.
+        cluster (dict, optional): The addresses of already running servers ('worker' and 'ps'
+        lists, e.g. on other hosts). Defaults to `num_workers` workers launched on localhost.
+        work_dir (str, optional): The directory of the shards and of the training cache.
+        Defaults to a temporary directory.
+        shards_per_worker (int, optional): The number of dataset shards per worker.
+        max_restarts (int, optional): How many times a failed local server is restarted. The
+        training is aborted (and the servers stopped) when a server fails once more.
+        **hyperparameters: Passed to `DistributedGradientBoostedTreesModel`.
+
+    Returns:
+        tuple: The trained model and a report with the training time and, for each worker:
+            - cpu_seconds: the measured CPU time of the worker process (None for workers not
+            launched by this function),
+            - restarts: its number of restarts (None for workers not launched by this function),
+            - assigned_rows and estimated_rows_per_second: an estimate, assuming worker i reads
+            shards i, i + n, ... during the whole training. The shards actually read by each
+            worker are decided by TensorFlow Decision Forests and are not reported.
+
+    Raises:
+        RuntimeError: If a local server failed more than `max_restarts` times.
+    """
+    work_dir = work_dir or tempfile.mkdtemp(prefix="distributed_gbt_")
+    launch = cluster is None
+    cluster = cluster or local_cluster_spec(num_workers)
+    num_workers = len(cluster["worker"])
+    dataset_path, shard_sizes = shard_dataset(train_data, os.path.join(work_dir, "shards"),
+                                              num_workers * shards_per_worker)
+
+    with LocalCluster(cluster, max_restarts) if launch else contextlib.nullcontext() as servers:
+        resolver = tf.distribute.cluster_resolver.SimpleClusterResolver(
+            tf.train.ClusterSpec(cluster), rpc_layer="grpc")
+        strategy = tf.distribute.experimental.ParameterServerStrategy(resolver)
+        with strategy.scope():
+            model = tfdf.keras.DistributedGradientBoostedTreesModel(
+                task=tfdf.keras.Task.REGRESSION,
+                temp_directory=os.path.join(work_dir, "cache"),
+                **hyperparameters)
+        logging.info("Distributed training started on %d workers.", num_workers)
+        start = time.perf_counter()
+        _fit_until_failure(lambda: model.fit_on_dataset_path(
+            train_path=dataset_path, label_key=label, dataset_format="csv"), servers)
+        seconds = time.perf_counter() - start
+
+    report = {"seconds": seconds, "rows": len(train_data), "workers": []}
+    for i, address in enumerate(cluster["worker"]):
+        rows = sum(shard_sizes[i::num_workers])
+        worker = {
+            "address": address,
+            "cpu_seconds": servers.cpu_seconds("worker", i) if servers is not None else None,
+            "restarts": servers.restarts[("worker", i)] if servers is not None else None,
+            "assigned_rows": rows,
+            "estimated_rows_per_second": rows / seconds,
+        }
+        report["workers"].append(worker)
+        logging.info("Worker %d (%s): %s CPU seconds, %s restarts, ~%.0f rows/s (estimated).",
+                     i, address, worker["cpu_seconds"], worker["restarts"], rows / seconds)
+    logging.info("Distributed training done in %.1fs on %d workers.", seconds, num_workers)
+    return model, report
+
+
+@click.group()
+def cli():
+    """ Distributed training of a Gradient Boosted Trees model.
+    """
+
+
+@cli.command()
+@click.argument('train_data_path', type=click.Path(exists=True))
+@click.argument('model_save_path', type=click.Path())
+@click.option('--num-workers', default=2, help="Number of local workers.")
+@click.option('--num-trees', default=300, help="Number of trees.")
+@click.option('--work-dir', default=None, type=click.Path(), help="Shards and cache directory.")
+def train(train_data_path, model_save_path, num_workers, num_trees, work_dir):
+    """ Trains a model on the processed training data with local workers and saves it.
+    """
+    train_data = pd.read_csv(train_data_path)
+    model, report = train_distributed(train_data, num_workers=num_workers, work_dir=work_dir,
+                                      num_trees=num_trees)
+    model.save(model_save_path)
+    logging.info("Model saved to %s", model_save_path)
+    click.echo(json.dumps(report, indent=2))
+
+
+@cli.command()
+@click.option('--cluster', required=True, help="Cluster description, as JSON.")
+@click.option('--job-name', required=True, type=click.Choice(['worker', 'ps']))
+@click.option('--task-index', required=True, type=int)
+def server(cluster, job_name, task_index):
+    """ Runs a worker or parameter server of the cluster (launched by `train`).
+    """
+    run_server(json.loads(cluster), job_name, task_index)
+
+
+if __name__ == '__main__':
+    LOG_FMT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    logging.basicConfig(level=logging.INFO, format=LOG_FMT)
+    cli()
@@ -0,0 +1,388 @@
+"""
+This module monitors whether the data sent to the model for scoring still resembles the training
+data. Each column is summarized in a single pass by a mergeable sketch of constant size (a KLL
+quantile sketch for numerical columns, a Misra-Gries frequency sketch for categorical ones, and
+a null counter), so that the monitor can run inline on every scoring batch, sketches from
+parallel workers can be merged, and drift scores (PSI, Kolmogorov-Smirnov) can be computed at any
+time from the sketches alone.
+
+Imports:
+    json: Used to store the training baseline next to the saved model.
+    logging: Used for tracking events that happen when the software runs.
+    pathlib.Path: Used for manipulating filesystem paths in an object-oriented way.
+    numpy (np): Provides the vectorized sketch updates.
+    pandas (pd): Provides data structures and data analysis tools.
+"""
+import json
+import logging
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+
+BASELINE_FILE = "drift_baseline.json"
+
+
+class QuantileSketch:
+    """
+    KLL quantile sketch: a stack of compactors where the items of level h weigh 2**h. When a
+    level exceeds its capacity, it is sorted and every other item is promoted to the next level.
+    """
+
+    def __init__(self, k=200, seed=0):
+        self.k = k
+        self.levels = [np.empty(0)]
+        self.count = 0
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level):
+        return max(2, int(self.k * (2 / 3) ** (len(self.levels) - 1 - level)))
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # An odd item out stays at this level so that the total weight is kept.
+                kept, items = items[:len(items) % 2], items[len(items) % 2:]
+                promoted = items[self._rng.integers(2)::2]
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+                self.levels[level] = kept
+            level += 1
+
+    def update(self, values):
+        """
+        Add an array of values (NaN values must have been removed).
+        """
+        self.levels[0] = np.concatenate([self.levels[0], np.asarray(values, dtype=float)])
+        self.count += len(values)
+        self._compress()
+
+    def merge(self, other):
+        """
+        Add the content of another sketch to this one.
+        """
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.count += other.count
+        self._compress()
+        return self
+
+    def _weighted_items(self):
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level_items), 2.0 ** level)
+                                  for level, level_items in enumerate(self.levels)])
+        order = np.argsort(items, kind="stable")
+        return items[order], np.cumsum(weights[order])
+
+    def items(self):
+        """
+        Return the sorted items retained by the sketch.
+        """
+        return self._weighted_items()[0]
+
+    def cdf(self, values):
+        """
+        Estimate the fraction of the values lower than or equal to each given value.
+        """
+        items, cumulative = self._weighted_items()
+        if len(items) == 0:
+            return np.zeros(len(values))
+        positions = np.searchsorted(items, values, side="right")
+        return np.concatenate([[0.0], cumulative])[positions] / cumulative[-1]
+
+    def quantiles(self, fractions):
+        """
+        Estimate the quantiles of the given fractions.
+        """
+        items, cumulative = self._weighted_items()
+        if len(items) == 0:
+            return np.full(len(fractions), np.nan)
+        positions = np.searchsorted(cumulative / cumulative[-1], fractions, side="left")
+        return items[np.minimum(positions, len(items) - 1)]
+
+    def to_dict(self):
+        return {"k": self.k, "count": self.count,
+                "levels": [items.tolist() for items in self.levels]}
+
+    @classmethod
+    def from_dict(cls, state):
+        sketch = cls(k=state["k"])
+        sketch.levels = [np.asarray(items, dtype=float) for items in state["levels"]]
+        sketch.count = state["count"]
+        return sketch
+
+
+class FrequencySketch:
+    """
+    Misra-Gries frequency sketch: keeps at most `capacity` counters, the counts of the most
+    frequent values being underestimated by at most count / (capacity + 1).
+    """
+
+    def __init__(self, capacity=100):
+        self.capacity = capacity
+        self.counts = {}
+        self.count = 0
+
+    def _add(self, counts, count):
+        for value, value_count in counts.items():
+            self.counts[value] = self.counts.get(value, 0) + value_count
+        self.count += count
+        if len(self.counts) > self.capacity:
+            threshold = sorted(self.counts.values(), reverse=True)[self.capacity]
+            self.counts = {value: value_count - threshold
+                           for value, value_count in self.counts.items()
+                           if value_count > threshold}
+
+    def update(self, values):
+        """
+        Add a Series of values (NaN values must have been removed).
+        """
+        counts = values.astype(str).value_counts()
+        self._add(dict(zip(counts.index, counts.to_numpy().tolist())), len(values))
+
+    def merge(self, other):
+        """
+        Add the content of another sketch to this one.
+        """
+        self._add(other.counts, other.count)
+        return self
+
+    def frequencies(self, values):
+        """
+        Estimate the frequency of each given value, and of all the other values as a last item.
+        """
+        if self.count == 0:
+            return np.zeros(len(values) + 1)
+        frequencies = np.array([self.counts.get(value, 0) for value in values]) / self.count
+        return np.append(frequencies, max(1.0 - frequencies.sum(), 0.0))
+
+    def to_dict(self):
+        return {"capacity": self.capacity, "count": self.count, "counts": self.counts}
+
+    @classmethod
+    def from_dict(cls, state):
+        sketch = cls(capacity=state["capacity"])
+        sketch.counts = dict(state["counts"])
+        sketch.count = state["count"]
+        return sketch
+
+
+class ColumnProfile:
+    """
+    Sketch of a column: its null count and a quantile or frequency sketch of its values.
+    """
+
+    def __init__(self, numeric, k=200, capacity=100):
+        self.numeric = numeric
+        self.sketch = QuantileSketch(k) if numeric else FrequencySketch(capacity)
+        self.rows = 0
+        self.nulls = 0
+
+    @property
+    def null_rate(self):
+        return self.nulls / self.rows if self.rows else 0.0
+
+    def update(self, column):
+        missing = column.isna()
+        self.rows += len(column)
+        self.nulls += int(missing.sum())
+        values = column[~missing]
+        if self.numeric:
+            values = pd.to_numeric(values, errors="coerce").dropna().to_numpy()
+        self.sketch.update(values)
+
+    def merge(self, other):
+        self.rows += other.rows
+        self.nulls += other.nulls
+        self.sketch.merge(other.sketch)
+        return self
+
+    def to_dict(self):
+        return {"numeric": self.numeric, "rows": self.rows, "nulls": self.nulls,
+                "sketch": self.sketch.to_dict()}
+
+    @classmethod
+    def from_dict(cls, state):
+        profile = cls(state["numeric"])
+        sketch_class = QuantileSketch if state["numeric"] else FrequencySketch
+        profile.sketch = sketch_class.from_dict(state["sketch"])
+        profile.rows = state["rows"]
+        profile.nulls = state["nulls"]
+        return profile
+
+
+def _psi(expected, actual, epsilon=1e-4):
+    """
+    Population Stability Index between two binned distributions.
+    """
+    expected = np.clip(expected, epsilon, None)
+    actual = np.clip(actual, epsilon, None)
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+
+def column_drift(baseline, current, bins=10):
+    """
+    Compare the current profile of a column to its baseline.
+
+    Returns:
+        dict: The PSI of the values, the Kolmogorov-Smirnov statistic (numerical columns only)
+        and the null rates.
+    """
+    scores = {"psi": np.nan, "ks": np.nan, "baseline_null_rate": baseline.null_rate,
+              "null_rate": current.null_rate}
+    if current.sketch.count == 0 or baseline.sketch.count == 0:
+        return scores
+    if baseline.numeric:
+        edges = np.unique(baseline.sketch.quantiles(np.linspace(0, 1, bins + 1)[1:-1]))
+        expected = np.diff(np.concatenate([[0.0], baseline.sketch.cdf(edges), [1.0]]))
+        actual = np.diff(np.concatenate([[0.0], current.sketch.cdf(edges), [1.0]]))
+        points = np.concatenate([baseline.sketch.items(), current.sketch.items()])
+        scores["ks"] = float(np.max(np.abs(baseline.sketch.cdf(points)
+                                           - current.sketch.cdf(points))))
+    else:
+        values = sorted(set(baseline.sketch.counts) | set(current.sketch.counts))
+        expected = baseline.sketch.frequencies(values)
+        actual = current.sketch.frequencies(values)
+    scores["psi"] = _psi(expected, actual)
+    return scores
+
+
+class DataProfile:
+    """
+    Sketches of all the columns of a dataset, updated batch by batch.
+    """
+
+    def __init__(self, numeric_columns=None, k=200, capacity=100):
+        # Column name -> whether it is numerical; unknown columns are typed on first sight.
+        self.types = dict(numeric_columns or {})
+        self.k = k
+        self.capacity = capacity
+        self.columns = {}
+
+    def _profile(self, name, numeric):
+        if name not in self.columns:
+            self.columns[name] = ColumnProfile(self.types.setdefault(name, numeric), self.k,
+                                               self.capacity)
+        return self.columns[name]
+
+    def update(self, data):
+        """
+        Add a batch of rows. Expected columns missing from the batch are counted as nulls.
+        """
+        for name in set(self.types) | set(data.columns):
+            if name in data.columns:
+                column = data[name]
+            else:
+                column = pd.Series(np.nan, index=data.index)
+            numeric = pd.api.types.is_numeric_dtype(column)
+            self._profile(name, numeric).update(column)
+        return self
+
+    def merge(self, other):
+        """
+        Add the content of another profile (e.g. computed by another worker) to this one.
+        """
+        for name, profile in other.columns.items():
+            self._profile(name, profile.numeric).merge(profile)
+        return self
+
+    def to_dict(self):
+        return {"k": self.k, "capacity": self.capacity,
+                "columns": {name: profile.to_dict() for name, profile in self.columns.items()}}
+
+    @classmethod
+    def from_dict(cls, state):
+        profile = cls(k=state["k"], capacity=state["capacity"])
+        for name, column in state["columns"].items():
+            profile.columns[name] = ColumnProfile.from_dict(column)
+            profile.types[name] = column["numeric"]
+        return profile
+
+
+class DriftMonitor:
+    """
+    Compares the scoring data to the training baseline stored with the model.
+
+    Usage:
+        monitor = DriftMonitor.from_training_data(train_data.drop('SalePrice', axis=1))
+        save_model(model, model_path, baseline=monitor)
+        ...
+        monitor = DriftMonitor.load(model_path)
+        make_predictions(model, data, monitor=monitor)
+        monitor.drift_scores()
+    """
+
+    def __init__(self, baseline, ignore=('Id',)):
+        self.baseline = baseline
+        self.ignore = set(ignore)
+        self.current = DataProfile(baseline.types, baseline.k, baseline.capacity)
+
+    @classmethod
+    def from_training_data(cls, data, ignore=('Id',), k=200, capacity=100):
+        """
+        Build the baseline from the training data.
+        """
+        data = data.drop(columns=[name for name in ignore if name in data.columns])
+        return cls(DataProfile(k=k, capacity=capacity).update(data), ignore)
+
+    def update(self, data):
+        """
+        Add a scoring batch to the current profile. Columns unknown to the baseline are ignored.
+        """
+        columns = [name for name in data.columns
+                   if name in self.baseline.types and name not in self.ignore]
+        self.current.update(data[columns])
+        return self
+
+    def merge(self, other):
+        """
+        Add the scoring batches seen by another monitor of the same baseline.
+        """
+        self.current.merge(other.current)
+        return self
+
+    def reset(self):
+        """
+        Forget the scoring batches seen so far.
+        """
+        self.current = DataProfile(self.baseline.types, self.baseline.k, self.baseline.capacity)
+
+    def drift_scores(self, bins=10):
+        """
+        Compute the drift scores of every column seen in scoring.
+
+        Returns:
+            DataFrame: One row per column, with its PSI, Kolmogorov-Smirnov statistic and null
+            rates, sorted by decreasing PSI.
+        """
+        scores = {name: column_drift(self.baseline.columns[name], profile, bins)
+                  for name, profile in self.current.columns.items()
+                  if name in self.baseline.columns}
+        scores = pd.DataFrame.from_dict(scores, orient="index",
+                                        columns=["psi", "ks", "baseline_null_rate", "null_rate"])
+        return scores.sort_values("psi", ascending=False)
+
+    def save(self, model_path):
+        """
+        Save the baseline in the model directory.
+        """
+        path = Path(model_path) / BASELINE_FILE
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, mode='w', encoding='utf-8') as file:
+            json.dump({"ignore": sorted(self.ignore), "baseline": self.baseline.to_dict()}, file)
+        logging.info("Drift baseline saved to %s", path)
+
+    @classmethod
+    def load(cls, model_path):
+        """
+        Load the baseline saved in the model directory.
+        """
+        with open(Path(model_path) / BASELINE_FILE, mode='r', encoding='utf-8') as file:
+            state = json.load(file)
+        return cls(DataProfile.from_dict(state["baseline"]), state["ignore"])
@@ -0,0 +1,371 @@
+"""
+This module explains the predictions of a trained TensorFlow Decision Forests model with per-row
+feature contributions (SHAP values), computed exactly by the polynomial-time TreeSHAP algorithm
+on the tree structure exported by the model inspector. The contributions of a row add up, with
+the expected value of the model, to the predicted price of the row.
+
+Every root-to-leaf path of the forest is seen as a product of one factor per feature it tests,
+so the Shapley values of a path are read off a polynomial of degree equal to its number of
+distinct features. Paths are grouped by that degree and processed as numpy arrays, vectorized
+across rows and paths, and row chunks are spread over threads.
+
+Imports:
+    os: Used to get the number of available cores.
+    math: Used for the Shapley weights.
+    logging: Used for tracking events that happen when the software runs.
+    concurrent.futures.ThreadPoolExecutor: Used to process row chunks in parallel.
+    pathlib.Path: Used for manipulating filesystem paths in an object-oriented way.
+    numpy (np): Provides the vectorized computation of the contributions.
+    pandas (pd): Provides data structures and data analysis tools.
+    tf_keras: Loads the saved model.
+    tensorflow_decision_forests (tfdf): Provides the model inspector and the tree structure.
+"""
+import os
+import math
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import tf_keras
+import tensorflow_decision_forests as tfdf
+
+
+def _cover(node, covers):
+    """
+    Compute the number of training examples reaching each node, from the leaf counts.
+    """
+    if isinstance(node, tfdf.py_tree.node.LeafNode):
+        cover = getattr(node.value, "num_examples", None) or 1.0
+    else:
+        cover = _cover(node.pos_child, covers) + _cover(node.neg_child, covers)
+    covers[id(node)] = float(cover)
+    return covers[id(node)]
+
+
+def _leaf_paths(node, covers, path, paths):
+    """
+    List the (leaf, path) pairs of a tree, a path being a list of (condition, positive branch,
+    cover ratio) tuples from the root to the leaf.
+    """
+    if isinstance(node, tfdf.py_tree.node.LeafNode):
+        paths.append((node, path))
+        return
+    for child, positive in ((node.pos_child, True), (node.neg_child, False)):
+        ratio = covers[id(child)] / covers[id(node)]
+        _leaf_paths(child, covers, path + [(node.condition, positive, ratio)], paths)
+
+
+def _condition_feature(condition):
+    """
+    Return the name of the feature tested by a condition.
+    """
+    if not hasattr(condition, "feature"):
+        raise ValueError(f"Unsupported condition for TreeSHAP: {condition}")
+    return condition.feature.name
+
+
+def _group_paths(paths, n_splits):
+    """
+    Stack the paths having the same number of distinct features into arrays.
+    """
+    length = max(len(path["nodes"]) for path in paths)
+    group = {
+        "value": np.array([path["value"] for path in paths]),
+        "feature": np.array([path["features"] for path in paths]),
+        "zero": np.array([path["zeros"] for path in paths]),
+        # Padding points to the last decision column, which is always True.
+        "node": np.full((len(paths), length), n_splits),
+        "positive": np.ones((len(paths), length), dtype=bool),
+        "slot": np.full((len(paths), length), -1),
+    }
+    for i, path in enumerate(paths):
+        size = len(path["nodes"])
+        group["node"][i, :size] = path["nodes"]
+        group["positive"][i, :size] = path["positives"]
+        group["slot"][i, :size] = path["slots"]
+
+    # Order of the (path, feature) pairs by feature, to sum the contributions with reduceat.
+    flat_features = group["feature"].reshape(-1)
+    group["order"] = np.argsort(flat_features, kind="stable")
+    group["columns"], group["starts"] = np.unique(flat_features[group["order"]],
+                                                  return_index=True)
+    return group
+
+
+def _make_inspector(model):
+    """
+    Return the inspector of a trained model, or of a saved model given by its path (a model loaded
+    with tf_keras has no inspector).
+    """
+    if isinstance(model, (str, os.PathLike)):
+        return tfdf.inspector.make_inspector(os.path.join(model, "assets"))
+    return model.make_inspector()
+
+
+def compile_forest(model):
+    """
+    Export the trees of a model into the arrays used by `tree_shap`.
+
+    Parameters:
+        model: The trained TensorFlow Decision Forests model (Random Forest or Gradient Boosted
+        Trees), or the path of the saved model.
+
+    Returns:
+        dict: The feature names, the categorical features, the split conditions, the expected
+        value of the model and the paths of the forest grouped by number of distinct features.
+    """
+    inspector = _make_inspector(model)
+    trees = inspector.extract_all_trees()
+    if inspector.model_type() == "GRADIENT_BOOSTED_TREES":
+        scale = 1.0
+        expected_value = float(inspector.specialized_header().initial_predictions[0])
+    else:
+        scale = 1.0 / len(trees)
+        expected_value = 0.0
+
+    features = [feature.name for feature in inspector.features()]
+    feature_index = {name: i for i, name in enumerate(features)}
+    splits, split_index, paths = [], {}, {}
+    for tree in trees:
+        covers = {}
+        root_cover = _cover(tree.root, covers)
+        leaf_paths = []
+        _leaf_paths(tree.root, covers, [], leaf_paths)
+        for leaf, path in leaf_paths:
+            value = scale * leaf.value.value
+            expected_value += value * covers[id(leaf)] / root_cover
+            slots, zeros, compiled = {}, [], {"nodes": [], "positives": [], "slots": []}
+            for condition, positive, ratio in path:
+                if id(condition) not in split_index:
+                    split_index[id(condition)] = len(splits)
+                    splits.append(condition)
+                feature = feature_index[_condition_feature(condition)]
+                if feature not in slots:
+                    slots[feature] = len(slots)
+                    zeros.append(1.0)
+                zeros[slots[feature]] *= ratio
+                compiled["nodes"].append(split_index[id(condition)])
+                compiled["positives"].append(positive)
+                compiled["slots"].append(slots[feature])
+            if not slots:
+                continue
+            compiled.update(value=value, features=list(slots), zeros=zeros)
+            paths.setdefault(len(slots), []).append(compiled)
+
+    groups = {depth: _group_paths(group, len(splits)) for depth, group in paths.items()}
+    logging.info("Forest compiled: %d trees, %d splits, %d paths.", len(trees), len(splits),
+                 sum(len(group) for group in paths.values()))
+    categorical = [feature.name for feature in inspector.features()
+                   if feature.type == tfdf.inspector.ColumnType.CATEGORICAL]
+    return {"features": features, "categorical": categorical, "splits": splits,
+            "expected_value": expected_value, "groups": groups}
+
+
+def _numeric(data, name):
+    """
+    Return a column as floats, missing columns being all NaN.
+    """
+    if name not in data:
+        return np.full(len(data), np.nan)
+    return pd.to_numeric(data[name], errors="coerce").to_numpy(dtype=float)
+
+
+def _decisions(splits, data):
+    """
+    Evaluate every split condition on every row: True when the row goes to the positive child.
+    The last column is always True and is used for path padding.
+    """
+    decisions = np.ones((len(data), len(splits) + 1), dtype=bool)
+    thresholds = {}
+    for i, condition in enumerate(splits):
+        if isinstance(condition, tfdf.py_tree.condition.NumericalHigherThanCondition):
+            thresholds.setdefault(condition.feature.name, []).append(i)
+            continue
+        name = _condition_feature(condition)
+        column = data[name] if name in data else pd.Series(np.nan, index=data.index)
+        missing = column.isna().to_numpy()
+        if isinstance(condition, tfdf.py_tree.condition.IsMissingInCondition):
+            decisions[:, i] = missing
+            continue
+        if isinstance(condition, tfdf.py_tree.condition.CategoricalIsInCondition):
+            values = column.astype(str).isin([str(item) for item in condition.mask]).to_numpy()
+        elif isinstance(condition, tfdf.py_tree.condition.IsTrueCondition):
+            values = column.fillna(False).astype(bool).to_numpy()
+        else:
+            raise ValueError(f"Unsupported condition for TreeSHAP: {condition}")
+        decisions[:, i] = np.where(missing, bool(condition.missing_evaluation), values)
+
+    # Numerical splits are evaluated all at once for each feature.
+    for name, indices in thresholds.items():
+        column = _numeric(data, name)[:, None]
+        threshold = np.array([splits[i].threshold for i in indices])
+        missing = np.array([bool(splits[i].missing_evaluation) for i in indices])
+        with np.errstate(invalid="ignore"):
+            decisions[:, indices] = np.where(np.isnan(column), missing, column >= threshold)
+    return decisions
+
+
+def _group_contributions(group, decisions):
+    """
+    Compute the contributions of the paths of one group for a chunk of rows.
+
+    For a path with distinct features D, leaf value v, and for each feature j its "zero
+    fraction" z_j (share of the training examples following the path on j) and "one fraction"
+    o_j (1 if the row follows the path on j, else 0), the Shapley value of feature i is
+    v * (o_i - z_i) * sum_k k!(d-1-k)!/d! * [t^k] prod_{j != i} (z_j + o_j t).
+
+    The working arrays are laid out as (degree or feature, path, row), so that every step of the
+    recurrences reads and updates contiguous (path, row) slices in place.
+
+    Parameters:
+        group (dict): The paths of one group, from `compile_forest`.
+        decisions (numpy.ndarray): The split decisions, one row per split (see `_decisions`) and
+        one column per data row.
+    """
+    n_rows = decisions.shape[1]
+    n_paths, depth = group["feature"].shape
+    paths = np.arange(n_paths)
+    ones = np.ones((depth, n_paths, n_rows), dtype=bool)
+    for position in range(group["node"].shape[1]):
+        follows = decisions[group["node"][:, position]] == group["positive"][:, position, None]
+        ones[group["slot"][:, position], paths] &= follows
+    zeros = group["zero"].T[:, :, None]
+    buffer = np.empty((n_paths, n_rows))
+
+    # Coefficients of prod_j (z_j + o_j t), from degree 0 to degree `depth`.
+    product = np.zeros((depth + 1, n_paths, n_rows))
+    product[0] = 1.0
+    for j in range(depth):
+        for k in range(j + 1, 0, -1):
+            np.multiply(product[k - 1], ones[j], out=buffer)
+            product[k] *= zeros[j]
+            product[k] += buffer
+        product[0] *= zeros[j]
+
+    weights = np.array([math.factorial(k) * math.factorial(depth - 1 - k)
+                        for k in range(depth)]) / math.factorial(depth)
+    # When o_i = 0 the product is divided by z_i: its weighted sum is shared by all features.
+    off_path = np.tensordot(weights, product[:depth], axes=1)
+    contributions = np.empty((n_paths, depth, n_rows))
+    unwound = np.empty((n_paths, n_rows))
+    for i in range(depth):
+        total = contributions[:, i]
+        # When o_i = 1 the product is divided by (z_i + t), top-down.
+        np.copyto(unwound, product[depth])
+        np.multiply(unwound, weights[depth - 1], out=total)
+        for k in range(depth - 1, 0, -1):
+            unwound *= -zeros[i]
+            unwound += product[k]
+            np.multiply(unwound, weights[k - 1], out=buffer)
+            total += buffer
+        np.divide(off_path, zeros[i], out=buffer)
+        np.copyto(total, buffer, where=~ones[i])
+        np.subtract(ones[i], zeros[i], out=buffer)
+        total *= buffer
+    contributions *= group["value"][:, None, None]
+
+    flat = contributions.reshape(n_paths * depth, n_rows)[group["order"]]
+    return group["columns"], np.add.reduceat(flat, group["starts"], axis=0).T
+
+
+def _chunk_contributions(forest, data):
+    """
+    Compute the contributions of all the features for a chunk of rows.
+    """
+    decisions = np.ascontiguousarray(_decisions(forest["splits"], data).T)
+    contributions = np.zeros((len(data), len(forest["features"])))
+    for group in forest["groups"].values():
+        columns, values = _group_contributions(group, decisions)
+        contributions[:, columns] += values
+    return contributions
+
+
+def tree_shap(model, data, n_jobs=None, chunk_size=None, max_chunk_elements=20_000_000):
+    """
+    Compute the TreeSHAP feature contributions of every row of a DataFrame.
+
+    Parameters:
+        model: The trained TensorFlow Decision Forests model, the path of the saved model, or
+        its `compile_forest` export (to avoid exporting the trees again on every batch).
+        data (DataFrame): The rows to explain, with the same feature columns as for training.
+        n_jobs (int, optional): The number of threads. Defaults to the number of cores.
+        chunk_size (int, optional): The number of rows processed at once. Defaults to the
+        largest chunk keeping the working arrays under `max_chunk_elements` values.
+        max_chunk_elements (int, optional): The memory budget of a chunk, in array values.
+
+    Returns:
+        DataFrame: One column per feature (indexed as `data`), plus an 'Expected_Value' column.
+        Each row adds up to the prediction of the model for that row.
+    """
+    forest = model if isinstance(model, dict) else compile_forest(model)
+    if chunk_size is None:
+        per_row = max(4 * group["feature"].size + 3 * len(group["feature"])
+                      for group in forest["groups"].values())
+        chunk_size = max(1, max_chunk_elements // max(per_row, 1))
+    chunks = [data.iloc[start:start + chunk_size] for start in range(0, len(data), chunk_size)]
+
+    with ThreadPoolExecutor(max_workers=n_jobs or os.cpu_count()) as executor:
+        results = list(executor.map(lambda chunk: _chunk_contributions(forest, chunk), chunks))
+
+    values = np.concatenate(results) if results else np.zeros((0, len(forest["features"])))
+    contributions = pd.DataFrame(values, index=data.index, columns=forest["features"])
+    contributions["Expected_Value"] = forest["expected_value"]
+    return contributions
+
+
+def save_contributions(model, data_path, output_path, chunksize=10_000, n_jobs=None,
+                       model_path=None):
+    """
+    Stream a CSV file through the model and write, for each row, its prediction and its feature
+    contributions to a CSV file, one chunk at a time so that memory stays bounded.
+
+    Parameters:
+        model: The trained TensorFlow Decision Forests model.
+        data_path (str): Path to the data file on which predictions are to be made.
+        output_path (str): Path where the predictions and contributions will be saved.
+        chunksize (int, optional): The number of rows read at once. Defaults to 10 000.
+        n_jobs (int, optional): The number of threads. Defaults to the number of cores.
+        model_path (str, optional): The saved model to read the trees from, required when the
+        model was loaded with tf_keras.
+    """
+    forest = compile_forest(model if model_path is None else model_path)
+    n_rows = 0
+    # The categorical features are read as strings, so that a chunk in which such a column is
+    # empty, or looks numerical, is not read as floats.
+    chunks = pd.read_csv(data_path, chunksize=chunksize,
+                         dtype=dict.fromkeys(forest["categorical"], str))
+    for i, chunk in enumerate(chunks):
+        features = chunk.drop('Id', axis=1, errors='ignore')
+        dataset = tfdf.keras.pd_dataframe_to_tf_dataset(features,
+                                                        task=tfdf.keras.Task.REGRESSION,
+                                                        batch_size=chunksize)
+        predictions = np.asarray(model.predict(dataset, verbose=0)).reshape(-1)
+        contributions = tree_shap(forest, features, n_jobs=n_jobs).add_prefix('Contribution_')
+        output = pd.concat([chunk[['Id']] if 'Id' in chunk else None,
+                            pd.DataFrame({'Predicted_Value': predictions}, index=chunk.index),
+                            contributions], axis=1)
+        output.to_csv(output_path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+        n_rows += len(chunk)
+        logging.info("Contributions saved for %d rows.", n_rows)
+
+
+def main(model_path, data_path, output_path):
+    """
+    Loads a model and saves the predictions and feature contributions of the provided data.
+
+    Parameters:
+        model_path (str): Path to the pre-trained machine learning model.
+        data_path (str): Path to the data file on which predictions are to be made.
+        output_path (str): Path where the predictions and contributions will be saved.
+    """
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    model = tf_keras.models.load_model(model_path)
+    save_contributions(model, data_path, output_path, model_path=model_path)
+
+
+if __name__ == "__main__":
+    MODEL_PATH = Path("../models/trained_model")
+    DATA_PATH = Path("../data/new_data.csv")
+    OUTPUT_PATH = Path("../data/contributions.csv")
+    main(MODEL_PATH, DATA_PATH, OUTPUT_PATH)
@@ -0,0 +1,155 @@
+"""
+This module computes partial dependence (PD) and individual conditional expectation (ICE) curves
+for a trained TensorFlow Decision Forests model, i.e. how the predicted price moves when a single
+feature is swept over a grid of values while every other column of a row is kept as is.
+
+Imports:
+    time: Used to measure the prediction latency and size the row sample accordingly.
+    logging: Used for tracking events that happen when the software runs.
+    collections.OrderedDict: Provides the least recently used cache of the results.
+    numpy (np): Provides the vectorized construction of the grid x rows cross product.
+    pandas (pd): Provides data structures and data analysis tools.
+    tensorflow_decision_forests (tfdf): Converts the cross product to a TensorFlow dataset.
+"""
+import time
+import logging
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import tensorflow_decision_forests as tfdf
+
+
+# Maximum number of results kept in the cache.
+CACHE_SIZE = 32
+
+# Results already computed, keyed by model, data, feature, grid and sample, least recently used
+# first.
+_PD_CACHE = OrderedDict()
+
+
+def make_grid(data, feature, num_points=20):
+    """
+    Build the value grid of a feature: evenly spaced quantiles for a numerical column, most
+    frequent values for a categorical one.
+    """
+    column = data[feature].dropna()
+    if column.empty:
+        return []
+    if pd.api.types.is_numeric_dtype(column):
+        grid = np.unique(column.quantile(np.linspace(0.0, 1.0, num_points)).to_numpy())
+        return grid.tolist()
+    return column.value_counts().index[:num_points].tolist()
+
+
+def predict_frame(model, frame, batch_size=8192):
+    """
+    Score a DataFrame in large batches and return a flat array of predictions.
+    """
+    dataset = tfdf.keras.pd_dataframe_to_tf_dataset(frame,
+                                                    task=tfdf.keras.Task.REGRESSION,
+                                                    batch_size=batch_size)
+    return np.asarray(model.predict(dataset, verbose=0)).reshape(-1)
+
+
+def cross_product(rows, feature, grid):
+    """
+    Repeat every row once per grid value and overwrite the feature with the grid value. The
+    result is ordered row by row: the grid values of the first row, then of the second row, etc.
+    Rows are selected by position, so that a non-unique index is supported.
+    """
+    product = rows.iloc[np.repeat(np.arange(len(rows)), len(grid))].reset_index(drop=True)
+    product[feature] = np.tile(np.asarray(grid), len(rows))
+    return product
+
+
+def sample_size(model, rows, feature, grid, latency_target, batch_size, probe_rows=256):
+    """
+    Estimate how many rows can be scored against the whole grid within the latency target,
+    by timing a probe batch (after a warm-up call that absorbs the graph tracing cost). The time
+    spent by the warm-up and the probe is deducted from the target.
+    """
+    start = time.perf_counter()
+    probe = cross_product(rows.iloc[:1], feature, grid[:1])
+    predict_frame(model, probe, batch_size)
+
+    probe = cross_product(rows.iloc[:probe_rows], feature, grid[:1])
+    probe_start = time.perf_counter()
+    predict_frame(model, probe, batch_size)
+    end = time.perf_counter()
+    seconds_per_row = max(end - probe_start, 1e-6) / len(probe)
+
+    remaining = max(latency_target - (end - start), 0.0)
+    return int(remaining / (seconds_per_row * len(grid)))
+
+
+def partial_dependence(model, data, feature, grid=None, num_points=20, latency_target=2.0,
+                       min_rows=50, max_rows=None, batch_size=8192, model_key=None,
+                       random_state=0):
+    """
+    Compute the ICE curves of a feature and, by averaging them, its partial dependence.
+
+    The grid x sampled rows cross product is scored with a few large vectorized `predict` calls
+    instead of one call per grid value. The number of sampled rows is adapted so that the
+    scoring fits within `latency_target` seconds, and results are cached per model, data (by a
+    hash of its content) and feature.
+
+    Parameters:
+        model: The trained TensorFlow Decision Forests model.
+        data (DataFrame): The rows to explain, with the same feature columns as for training.
+        feature (str): The feature to sweep.
+        grid (list, optional): The values to sweep the feature over. Defaults to `make_grid`.
+        num_points (int, optional): The grid size when `grid` is not given. Defaults to 20.
+        latency_target (float, optional): The scoring time budget, in seconds. Defaults to 2.0.
+        min_rows (int, optional): The minimum number of rows sampled. Defaults to 50.
+        max_rows (int, optional): The maximum number of rows sampled. Defaults to all rows.
+        batch_size (int, optional): The number of rows per `predict` batch. Defaults to 8192.
+        model_key (hashable, optional): Identifies the model in the cache (e.g. its name or
+        version); it must not be reused by another model. Results are not cached without it.
+        random_state (int, optional): The seed of the row sampling. Defaults to 0.
+
+    Returns:
+        DataFrame: The ICE curves, one row per sampled row (indexed as in `data`) and one column
+        per grid value. The partial dependence is `ice.mean(axis=0)`.
+
+    Raises:
+        ValueError: If the grid is empty (e.g. the feature only has missing values).
+    """
+    if grid is None:
+        grid = make_grid(data, feature, num_points)
+    grid = list(grid)
+    if not grid:
+        raise ValueError(f"Empty value grid for feature {feature}.")
+    max_rows = len(data) if max_rows is None else min(max_rows, len(data))
+    key = None
+    if model_key is not None:
+        data_hash = int(pd.util.hash_pandas_object(data, index=True).sum())
+        key = (model_key, data_hash, feature, tuple(grid), max_rows, latency_target, random_state)
+    if key is not None and key in _PD_CACHE:
+        _PD_CACHE.move_to_end(key)
+        logging.info("Partial dependence of %s loaded from cache.", feature)
+        return _PD_CACHE[key].copy()
+
+    rows = data.sample(frac=1.0, random_state=random_state)
+    n_rows = sample_size(model, rows, feature, grid, latency_target, batch_size)
+    n_rows = max(min(n_rows, max_rows), min(min_rows, max_rows))
+    rows = rows.iloc[:n_rows]
+
+    start = time.perf_counter()
+    predictions = predict_frame(model, cross_product(rows, feature, grid), batch_size)
+    ice = pd.DataFrame(predictions.reshape(len(rows), len(grid)), index=rows.index, columns=grid)
+    ice.columns.name = feature
+    logging.info("Partial dependence of %s computed on %d rows x %d values in %.2fs.",
+                 feature, len(rows), len(grid), time.perf_counter() - start)
+
+    if key is not None:
+        _PD_CACHE[key] = ice
+        if len(_PD_CACHE) > CACHE_SIZE:
+            _PD_CACHE.popitem(last=False)
+    return ice.copy()
+
+
+def clear_cache():
+    """
+    Drop all cached partial dependence results.
+    """
+    _PD_CACHE.clear()
@@ -7,10 +7,13 @@ prédictive, la gestion des chemins de fichiers, et la journalisation des opéra
   l'écosystème TensorFlow, permettant la construction, l'entraînement et l'évaluation de modèles de
   machine learning basés sur des arbres de décision avec une intégration profonde aux
   fonctionnalités de TensorFlow.
+- `tf_keras`: Charge le modèle sauvegardé.
 - `Path` de `pathlib`: Manipulation des chemins de fichiers, rendant la lecture, l'écriture et
   l'organisation des fichiers.
 - `logging`: Permet de configurer la journalisation à différents niveaux de détails (debug, info,
   warning, error), crucial pour le débogage et le suivi de l'état des applications en production.
+- `DriftMonitor`: Compare les données à prédire aux données d'entraînement (dérive des données).
+- `model_version`: Identifie la version du modèle chargé, pour invalider le cache des prédictions.
 
 Ces bibliothèques sont intégrées pour faciliter le développement de processus automatisés de
   traitement et d'analyse de données, ainsi que pour le suivi et la journalisation robuste des
@@ -19,15 +22,24 @@ Ces bibliothèques sont intégrées pour faciliter le développement de processu
 from pathlib import Path
 import logging
 import pandas as pd
+import tf_keras
 import tensorflow_decision_forests as tfdf
+try:
+    from .drift_monitor import BASELINE_FILE, DriftMonitor
+    from .prediction_cache import model_version
+except ImportError:
+    # Run as a script from src/models.
+    from drift_monitor import BASELINE_FILE, DriftMonitor
+    from prediction_cache import model_version
 
 
 def load_model(model_path):
     """
-    Load the saved TensorFlow Decision Forest model.
+    Load the saved TensorFlow Decision Forest model, and record its version.
     """
     try:
-        model = tfdf.keras.models.load_model(model_path)
+        model = tf_keras.models.load_model(model_path)
+        model.model_version = model_version(model_path)
         logging.info("Model loaded successfully.")
         return model
     except FileNotFoundError as e:
@@ -48,16 +60,32 @@ def load_data(data_path):
         return None
 
 
-def make_predictions(model, data):
+def _predict(model, data):
+    """
+    Convert the data to a TensorFlow dataset and predict it with the model.
+    """
+    # Assuming the model expects a TensorFlow dataset
+    prediction_data = tfdf.keras.pd_dataframe_to_tf_dataset(data,
+                                                            task=tfdf.keras.Task.REGRESSION)
+    return model.predict(prediction_data)
+
+
+def make_predictions(model, data, monitor=None, cache=None):
     """
     Use the loaded model to make predictions on the provided data.
+
+    If a drift monitor (see `drift_monitor.DriftMonitor`) is given, the data is also added to its
+    current profile. If a prediction cache (see `prediction_cache.PredictionCache`) is given,
+    only the rows missing from the cache are sent to the model.
     """
     if model is not None and data is not None:
         try:
-            # Assuming the model expects a TensorFlow dataset
-            prediction_data = tfdf.keras.pd_dataframe_to_tf_dataset(data,
-                                                                    task=tfdf.keras.Task.REGRESSION)
-            predictions = model.predict(prediction_data)
+            if monitor is not None:
+                monitor.update(data)
+            if cache is not None:
+                predictions = cache.predict(data, lambda rows: _predict(model, rows), model)
+            else:
+                predictions = _predict(model, data)
             logging.info("Predictions made successfully.")
             return predictions
         except FileNotFoundError as e:
@@ -93,9 +121,14 @@ def main(model_path, data_path, output_path):
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
     model = load_model(model_path)
     data = load_data(data_path)
-    predictions = make_predictions(model, data)
+    monitor = None
+    if (Path(model_path) / BASELINE_FILE).exists():
+        monitor = DriftMonitor.load(model_path)
+    predictions = make_predictions(model, data, monitor=monitor)
     if predictions is not None:
         save_predictions(predictions, output_path)
+    if monitor is not None:
+        logging.info("Drift scores of the scoring data:\n%s", monitor.drift_scores())
 
 
 if __name__ == "__main__":
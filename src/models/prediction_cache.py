@@ -0,0 +1,271 @@
+"""
+This module memoizes the predictions of the model. Each row is canonicalized (the 'Id' column is
+ignored, the columns are sorted, numbers are compared as floats) and hashed together with the
+model version, the hashes of a whole batch being computed at once. Only the rows missing from the
+cache are sent to the model, and the predictions are put back in the input order. The cache is
+bounded, either in memory (least recently used entries are evicted) or in an SQLite file, and it
+is emptied when it is used with a model of another version.
+
+Imports:
+    uuid: Used to version the models that were not loaded from disk.
+    hashlib: Used to hash the model version and the model files.
+    sqlite3: Provides the on-disk key-value store.
+    logging: Used for tracking events that happen when the software runs.
+    pathlib.Path: Used for manipulating filesystem paths in an object-oriented way.
+    numpy (np): Provides the vectorized lookups.
+    pandas (pd): Provides the vectorized row hashing.
+"""
+import uuid
+import hashlib
+import sqlite3
+import logging
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+
+def model_version(model_path):
+    """
+    Compute a version identifier of a saved model from the content of its files.
+    """
+    model_path = Path(model_path)
+    digest = hashlib.sha256()
+    if model_path.is_file():
+        digest.update(model_path.read_bytes())
+        return digest.hexdigest()
+    for path in sorted(path for path in model_path.rglob("*") if path.is_file()):
+        digest.update(str(path.relative_to(model_path)).encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def cache_version(model):
+    """
+    Return the version of a model: the one recorded by `predict_model.load_model`, or else a new
+    unique identifier attached to the model object.
+    """
+    version = getattr(model, "model_version", None)
+    if version is None:
+        version = f"unsaved-{uuid.uuid4().hex}"
+        model.model_version = version
+    return version
+
+
+def _hash_string(text):
+    return np.uint64(int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "little"))
+
+
+# Hash of a missing value, whatever the dtype of its column.
+_MISSING_HASH = _hash_string("<missing>")
+_HASH_MULTIPLIER = np.uint64(1_000_003)
+
+
+def row_keys(data, model_version_id="", ignore=('Id',)):
+    """
+    Hash every canonicalized row of a DataFrame, together with the model version. Numbers are
+    hashed as floats, other values as strings, and missing values hash the same whatever the dtype
+    of their column (e.g. an object column which is all missing in a batch is read as floats).
+
+    Returns:
+        numpy.ndarray: One uint64 key per row.
+    """
+    columns = sorted(name for name in data.columns if name not in ignore)
+    hashes = np.full(len(data), _hash_string(model_version_id + "|" + ",".join(columns)))
+    for name in columns:
+        column = data[name]
+        if pd.api.types.is_numeric_dtype(column):
+            values = column.to_numpy(dtype=float, na_value=np.nan)
+        else:
+            values = column.astype(str).to_numpy(dtype=object)
+        column_hashes = pd.util.hash_array(values)
+        column_hashes[column.isna().to_numpy()] = _MISSING_HASH
+        hashes = hashes * _HASH_MULTIPLIER ^ column_hashes
+    return hashes
+
+
+class _MemoryStore:
+    """
+    In-memory store evicting the least recently used entries. The keys are kept sorted in a numpy
+    array, so that a whole batch is looked up with a single binary search.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.version = None
+        self.clock = 0
+        self.clear()
+
+    def get_many(self, keys):
+        self.clock += 1
+        values = np.full(len(keys), np.nan)
+        found = np.zeros(len(keys), dtype=bool)
+        if len(self.keys):
+            positions = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+            found = self.keys[positions] == keys
+            values[found] = self.values[positions[found]]
+            self.used[positions[found]] = self.clock
+        return values, found
+
+    def put_many(self, keys, values):
+        self.clock += 1
+        new = ~np.isin(keys, self.keys)
+        keys = np.concatenate([self.keys, keys[new]])
+        values = np.concatenate([self.values, values[new]])
+        used = np.concatenate([self.used, np.full(int(new.sum()), self.clock)])
+        if len(keys) > self.max_entries:
+            kept = np.argpartition(-used, self.max_entries - 1)[:self.max_entries]
+            keys, values, used = keys[kept], values[kept], used[kept]
+        order = np.argsort(keys)
+        self.keys, self.values, self.used = keys[order], values[order], used[order]
+
+    def clear(self):
+        self.keys = np.empty(0, dtype=np.uint64)
+        self.values = np.empty(0)
+        self.used = np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.keys)
+
+
+class _SQLiteStore:
+    """
+    On-disk store in an SQLite file, evicting the least recently used entries.
+    """
+
+    # Maximum number of parameters of a query.
+    CHUNK = 900
+
+    def __init__(self, path, max_entries):
+        self.max_entries = max_entries
+        self.connection = sqlite3.connect(str(path), check_same_thread=False)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS predictions (
+                key INTEGER PRIMARY KEY, value REAL NOT NULL, used INTEGER NOT NULL);
+            CREATE INDEX IF NOT EXISTS predictions_used ON predictions (used);
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT);
+        """)
+        self.clock = self.connection.execute(
+            "SELECT COALESCE(MAX(used), 0) FROM predictions").fetchone()[0]
+
+    @property
+    def version(self):
+        row = self.connection.execute("SELECT value FROM meta WHERE name = 'version'").fetchone()
+        return row[0] if row else None
+
+    @version.setter
+    def version(self, value):
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (value,))
+
+    def get_many(self, keys):
+        # SQLite integers are signed: keys are stored as their int64 view.
+        signed = keys.view(np.int64).tolist()
+        found_values = {}
+        self.clock += 1
+        with self.connection:
+            for start in range(0, len(signed), self.CHUNK):
+                chunk = signed[start:start + self.CHUNK]
+                marks = ",".join("?" * len(chunk))
+                found_values.update(self.connection.execute(
+                    f"SELECT key, value FROM predictions WHERE key IN ({marks})", chunk))
+                self.connection.execute(
+                    f"UPDATE predictions SET used = ? WHERE key IN ({marks})", [self.clock, *chunk])
+        values = np.array([found_values.get(key, np.nan) for key in signed], dtype=float)
+        found = np.array([key in found_values for key in signed], dtype=bool)
+        return values, found
+
+    def put_many(self, keys, values):
+        self.clock += 1
+        rows = zip(keys.view(np.int64).tolist(), values.tolist(), [self.clock] * len(keys))
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO predictions VALUES (?, ?, ?)", rows)
+            self.connection.execute(
+                "DELETE FROM predictions WHERE key IN (SELECT key FROM predictions "
+                "ORDER BY used DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+
+    def clear(self):
+        with self.connection:
+            self.connection.execute("DELETE FROM predictions")
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+
+
+class PredictionCache:
+    """
+    Bounded cache of the predictions of a model version.
+
+    Usage:
+        cache = PredictionCache()
+        make_predictions(load_model(model_path), data, cache=cache)
+        cache.stats()
+    """
+
+    def __init__(self, version=None, max_entries=100_000, path=None, ignore=('Id',)):
+        """
+        Parameters:
+            version (str, optional): The model version, e.g. `model_version(model_path)`. It is
+            otherwise set from the model passed to `predict`.
+            max_entries (int, optional): The maximum number of cached predictions.
+            path (str, optional): The SQLite file of the cache. Defaults to an in-memory cache.
+            ignore (tuple, optional): The columns not used by the model. Defaults to ('Id',).
+        """
+        self.store = _MemoryStore(max_entries) if path is None else \
+            _SQLiteStore(path, max_entries)
+        self.ignore = tuple(ignore)
+        self.hits = 0
+        self.misses = 0
+        self.version = None
+        if version is not None:
+            self.set_version(version)
+
+    def set_version(self, version):
+        """
+        Set the model version, emptying the cache if it has changed.
+        """
+        if self.store.version != version:
+            if self.store.version is not None:
+                logging.info("Model version changed, prediction cache emptied.")
+            self.store.clear()
+            self.store.version = version
+        self.version = version
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        """
+        Return the hit-rate metrics of the cache.
+        """
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hit_rate,
+                "entries": len(self.store)}
+
+    def predict(self, data, predict_fn, model=None):
+        """
+        Return the predictions of the rows of a DataFrame, in the input order, calling
+        `predict_fn` (DataFrame -> array of predictions) on the rows missing from the cache only,
+        each distinct row being predicted once. If the model is given, the cache is first emptied
+        if its version (see `cache_version`) differs from the cached one.
+        """
+        if model is not None:
+            self.set_version(cache_version(model))
+        if self.version is None:
+            raise ValueError("The prediction cache needs a model or a model version.")
+        keys = row_keys(data, self.version, self.ignore)
+        predictions, found = self.store.get_many(keys)
+        self.hits += int(found.sum())
+        self.misses += int((~found).sum())
+
+        if not found.all():
+            missing = np.flatnonzero(~found)
+            unique_keys, first, inverse = np.unique(keys[missing], return_index=True,
+                                                    return_inverse=True)
+            values = np.asarray(predict_fn(data.iloc[missing[first]])).reshape(-1)
+            predictions[missing] = values[inverse]
+            self.store.put_many(unique_keys, values)
+
+        logging.info("Prediction cache: %d hits, %d misses in batch (hit rate %.1f%%).",
+                     int(found.sum()), int((~found).sum()), 100 * self.hit_rate)
+        return predictions.reshape(-1, 1)
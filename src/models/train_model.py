@@ -10,11 +10,17 @@ Imports:
     pathlib.Path: Used for manipulating filesystem paths in an object-oriented way.
     logging: Used for tracking events that happen when the software runs, which can be helpful for
     debugging.
+    DriftMonitor: Builds the training data baseline saved with the model.
 """
 from pathlib import Path
 import logging
 import pandas as pd
 import tensorflow_decision_forests as tfdf
+try:
+    from .drift_monitor import DriftMonitor
+except ImportError:
+    # Run as a script from src/models.
+    from drift_monitor import DriftMonitor
 
 
 def load_data(data_path):
@@ -73,13 +79,16 @@ def evaluate_model(model, dataset):
         return None
 
 
-def save_model(model, model_path):
+def save_model(model, model_path, baseline=None):
     """
-    Save the trained model.
+    Save the trained model, and the training data drift baseline (see
+    `drift_monitor.DriftMonitor`) alongside it if given.
     """
     try:
         model.save(model_path)
         logging.info("Model saved to %s", model_path)
+        if baseline is not None:
+            baseline.save(model_path)
     except FileNotFoundError as e:
         logging.error("Failed to save model. Error: %s", e)
 
@@ -108,7 +117,8 @@ def main(train_data_path, validation_data_path, model_save_path):
 
     if model is not None:
         evaluate_model(model, validation_dataset)
-        save_model(model, model_save_path)
+        baseline = DriftMonitor.from_training_data(train_data.drop('SalePrice', axis=1))
+        save_model(model, model_save_path, baseline=baseline)
 
 
 if __name__ == "__main__":
@@ -25,17 +25,22 @@ def house_price(dataset):
     return fig
 
 
-def evaluate_model(logs):
+def evaluate_model(logs, num_trees=None):
     """
     Trace la performance du modèle en fonction du nombre d'arbres utilisés.
 
     Paramètres:
         logs (list): Une liste d'objets d'inscription contenant les journaux de formation du modèle.
+        num_trees (int, optional): Le nombre d'arbres retenu par la compaction du modèle
+        (`compact_model.optimal_num_trees`), marqué d'une ligne verticale.
 
     La fonction utilise la fonction plot de matplotlib.pyplot pour tracer la performance du modèle.
     """
     fig, ax = plt.subplots()
     ax.plot([log.num_trees for log in logs], [log.evaluation.rmse for log in logs])
+    if num_trees is not None:
+        ax.axvline(num_trees, color='g', linestyle='--', label="Nombre d'arbres optimal")
+        ax.legend()
     ax.set_xlabel("Nombre d'arbres")
     ax.set_ylabel("RMSE (hors échantillon)")
     ax.set_title("Performance du modèle en fonction du nombre d'arbres")
@@ -78,3 +83,32 @@ def variable_weight(inspector):
     plt.tight_layout()
     fig = plt.gcf() 
     return fig
+
+
+def partial_dependence(ice, feature, max_ice_lines=50):
+    """
+    Trace la dépendance partielle d'une variable ainsi qu'un échantillon de courbes ICE.
+
+    Paramètres:
+        ice (DataFrame): Les courbes ICE, une ligne par maison et une colonne par valeur de la
+        variable, telles que renvoyées par `partial_dependence.partial_dependence`.
+        feature (str): Le nom de la variable étudiée.
+        max_ice_lines (int, optional): Le nombre maximal de courbes ICE tracées. Par défaut à 50.
+
+    La fonction utilise la fonction plot de matplotlib.pyplot pour tracer les courbes.
+    """
+    fig, ax = plt.subplots(figsize=(9, 6))
+    grid = list(ice.columns)
+    positions = grid if all(isinstance(x, (int, float)) for x in grid) else range(len(grid))
+    ice_sample = ice.iloc[:max_ice_lines]
+    ax.plot(positions, ice_sample.to_numpy().T, color='grey', alpha=0.2, linewidth=0.8)
+    ax.plot(positions, ice.mean(axis=0).to_numpy(), color='g', linewidth=3,
+            label="Dépendance partielle")
+    if positions is not grid:
+        ax.set_xticks(positions)
+        ax.set_xticklabels(grid, rotation=45)
+    ax.set_xlabel(feature)
+    ax.set_ylabel("Prix prédit")
+    ax.set_title(f"Dépendance partielle du prix à {feature} ({len(ice)} maisons)")
+    ax.legend()
+    return fig
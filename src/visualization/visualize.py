@@ -1,22 +1,33 @@
 """
 Ces imports permettent d'utiliser les fonctionnalités de la bibliothèque TensorFlow Decision 
-Forests et de gérer les chemins de recherche des modules Python.
+Forests et de gérer les chemins de recherche des modules Python, ainsi que de mesurer les temps
+d'entraînement et d'entraîner le modèle complet en arrière-plan.
 """
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
 import tensorflow_decision_forests as tfdf
 sys.path.append('../src/data')
 import make_dataset as md
 sys.path.append('../src/visualization')
 import plot as pl
+sys.path.append('../src/models')
+import partial_dependence as pdp
+import compact_model as cm
 
+# Les modèles complets sont entraînés un par un en arrière-plan.
+_executor = ThreadPoolExecutor(max_workers=1)
 
-def get_model(dataset_df, model):
+
+def get_model(dataset_df, model, **hyperparameters):
     """
     Crée et entraîne un modèle de forêt aléatoire TensorFlow Decision Forests à partir du dataset 
     fourni.
 
     Args:
         dataset_df (pandas.DataFrame): Le DataFrame contenant le dataset.
+        **hyperparameters: Les hyperparamètres du modèle (par exemple `num_trees`).
 
     Returns:
         tfdf.keras.Model: Le modèle entraîné.
@@ -26,32 +37,114 @@ def get_model(dataset_df, model):
     train_ds = tfdf.keras.pd_dataframe_to_tf_dataset(train_ds_pd,
                                                      label=label,
                                                      task=tfdf.keras.Task.REGRESSION)
-    rf = model(task=tfdf.keras.Task.REGRESSION)
+    rf = model(task=tfdf.keras.Task.REGRESSION, **hyperparameters)
     rf.fit(x=train_ds)
     return rf
 
 
-def evaluate_logs(dataset_df, model):
+def stratified_sample(dataset_df, n_rows, n_strata=10, random_state=0):
+    """
+    Tire un échantillon du dataset stratifié par déciles de prix de vente, afin que l'aperçu
+    couvre toute la gamme de prix.
+
+    Args:
+        dataset_df (pandas.DataFrame): Le DataFrame contenant le dataset.
+        n_rows (int): La taille (approximative) de l'échantillon.
+    """
+    if n_rows >= len(dataset_df):
+        return dataset_df
+    strata = pd.qcut(dataset_df['SalePrice'], q=n_strata, labels=False, duplicates='drop')
+    return dataset_df.groupby(strata).sample(frac=n_rows / len(dataset_df),
+                                             random_state=random_state)
+
+
+def get_preview_model(dataset_df, model, target_seconds=5.0, num_trees=50, min_rows=200):
+    """
+    Entraîne rapidement un modèle d'aperçu, avec moins d'arbres, sur un échantillon stratifié.
+    Un premier modèle est entraîné sur `min_rows` lignes afin de mesurer la vitesse
+    d'entraînement ; la taille de l'échantillon est ensuite extrapolée pour que l'entraînement
+    complet de l'aperçu (sonde comprise) dure environ `target_seconds` secondes. Si le temps
+    restant ne suffit pas pour un échantillon plus grand, le modèle de la sonde est conservé.
+
+    Args:
+        dataset_df (pandas.DataFrame): Le DataFrame contenant le dataset.
+        target_seconds (float, optional): Le temps visé avant le premier graphique.
+        num_trees (int, optional): Le nombre d'arbres de l'aperçu. Par défaut à 50.
+        min_rows (int, optional): La taille de l'échantillon de la sonde. Par défaut à 200.
+
+    Returns:
+        tuple: Le modèle d'aperçu et la taille de l'échantillon utilisé.
+    """
+    sample = stratified_sample(dataset_df, min_rows)
+    start = time.perf_counter()
+    rf = get_model(sample, model, num_trees=num_trees)
+    probe_seconds = time.perf_counter() - start
+    # Le temps de la sonde inclut les coûts fixes : l'extrapolation linéaire est prudente.
+    seconds_per_row = max(probe_seconds, 1e-6) / len(sample)
+    n_rows = int(max(target_seconds - probe_seconds, 0.0) / seconds_per_row)
+    if n_rows > len(sample):
+        sample = stratified_sample(dataset_df, n_rows)
+        rf = get_model(sample, model, num_trees=num_trees)
+    return rf, len(sample)
+
+
+def start_model(dataset_df, model):
+    """
+    Lance l'entraînement du modèle complet en arrière-plan.
+
+    Returns:
+        concurrent.futures.Future: Le futur modèle entraîné.
+    """
+    return _executor.submit(get_model, dataset_df, model)
+
+
+def evaluate_logs(dataset_df, model, rf=None):
     """
     Évalue les journaux d'entraînement du modèle de forêt aléatoire TensorFlow Decision Forests
-    et génère des visualisations pour évaluer la performance du modèle.
+    et génère des visualisations pour évaluer la performance du modèle, en marquant le nombre
+    d'arbres auquel la compaction tronquerait le modèle.
 
     Args:
         dataset_df (pandas.DataFrame): Le DataFrame contenant le dataset.
+        rf (tfdf.keras.Model, optional): Le modèle déjà entraîné. Par défaut, il est entraîné.
     """
-    rf = get_model(dataset_df, model)
+    if rf is None:
+        rf = get_model(dataset_df, model)
     logs = rf.make_inspector().training_logs()
-    return pl.evaluate_model(logs)
+    try:
+        num_trees, _, _ = cm.optimal_num_trees(logs)
+    except ValueError:
+        num_trees = None
+    return pl.evaluate_model(logs, num_trees)
 
 
-def plot_inspector(dataset_df, model):
+def plot_inspector(dataset_df, model, rf=None):
     """
     Génère des visualisations basées sur l'inspecteur du modèle de forêt aléatoire TensorFlow 
     Decision Forests.
 
     Args:
         dataset_df (pandas.DataFrame): Le DataFrame contenant le dataset.
+        rf (tfdf.keras.Model, optional): Le modèle déjà entraîné. Par défaut, il est entraîné.
     """
-    rf = get_model(dataset_df, model)
+    if rf is None:
+        rf = get_model(dataset_df, model)
     inspector = rf.make_inspector()
     return pl.variable_weight(inspector)
+
+
+def plot_partial_dependence(dataset_df, model, feature, rf=None):
+    """
+    Génère le graphique de dépendance partielle (et les courbes ICE) du prix prédit par le modèle
+    TensorFlow Decision Forests par rapport à la variable sélectionnée.
+
+    Args:
+        dataset_df (pandas.DataFrame): Le DataFrame contenant le dataset.
+        feature (str): La variable étudiée.
+        rf (tfdf.keras.Model, optional): Le modèle déjà entraîné. Par défaut, il est entraîné.
+    """
+    if rf is None:
+        rf = get_model(dataset_df, model)
+    ice = pdp.partial_dependence(rf, dataset_df.drop('SalePrice', axis=1), feature,
+                                 model_key=rf.name)
+    return pl.partial_dependence(ice, feature)
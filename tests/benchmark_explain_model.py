@@ -0,0 +1,49 @@
+"""
+Benchmark of the TreeSHAP contributions on a forest of the size of a default Gradient Boosted
+Trees model (300 trees of depth 6), on synthetic data. Run it with
+`python tests/benchmark_explain_model.py [num_rows]`.
+"""
+import sys
+import time
+import logging
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import tensorflow_decision_forests as tfdf
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "src" / "models"))
+import explain_model as em  # noqa: E402  pylint: disable=wrong-import-position
+
+
+def make_data(num_rows, num_features=30, seed=0):
+    rng = np.random.default_rng(seed)
+    data = pd.DataFrame(rng.normal(size=(num_rows, num_features)),
+                        columns=[f"f{i}" for i in range(num_features)])
+    data["SalePrice"] = (np.sin(3 * data["f0"]) + data["f1"] * data["f2"] - data["f3"] ** 2
+                         + rng.normal(scale=0.5, size=num_rows))
+    return data
+
+
+def main(num_rows=10_000):
+    train = make_data(20_000)
+    model = tfdf.keras.GradientBoostedTreesModel(task=tfdf.keras.Task.REGRESSION, num_trees=300,
+                                                 max_depth=6, early_stopping="NONE", verbose=0)
+    model.fit(tfdf.keras.pd_dataframe_to_tf_dataset(train, label="SalePrice",
+                                                    task=tfdf.keras.Task.REGRESSION))
+    data = make_data(num_rows, seed=1).drop("SalePrice", axis=1)
+
+    start = time.perf_counter()
+    forest = em.compile_forest(model)
+    compile_seconds = time.perf_counter() - start
+    paths = sum(len(group["value"]) for group in forest["groups"].values())
+    start = time.perf_counter()
+    em.tree_shap(forest, data, n_jobs=1)
+    seconds = time.perf_counter() - start
+    print(f"{model.make_inspector().num_trees()} trees, {paths} paths: compiled in "
+          f"{compile_seconds:.1f}s, {num_rows} rows explained in {seconds:.1f}s on one thread "
+          f"({num_rows / seconds:.0f} rows/s).")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,157 @@
+"""
+Tests of the distributed training, with all the servers on localhost. They are skipped when
+TensorFlow Decision Forests is not installed.
+"""
+import os
+import sys
+import time
+import socket
+import threading
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("tensorflow_decision_forests")
+sys.path.append(str(Path(__file__).resolve().parents[1] / "src" / "models"))
+import distributed_train as dt  # noqa: E402  pylint: disable=wrong-import-position
+
+
+def make_data(num_rows, num_features=8, seed=0):
+    rng = np.random.default_rng(seed)
+    data = pd.DataFrame(rng.normal(size=(num_rows, num_features)),
+                        columns=[f"f{i}" for i in range(num_features)])
+    data["SalePrice"] = 3 * data["f0"] - 2 * data["f1"] ** 2 + rng.normal(scale=0.1, size=num_rows)
+    return data
+
+
+def wait_for(condition, timeout=60.0, interval=0.2):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(interval)
+    return False
+
+
+def is_listening(address):
+    host, port = address.rsplit(":", 1)
+    try:
+        with socket.create_connection((host, int(port)), timeout=1):
+            return True
+    except OSError:
+        return False
+
+
+def test_free_ports_are_distinct():
+    ports = dt.free_ports(16)
+    assert len(set(ports)) == 16
+
+
+def test_shard_dataset(tmp_path):
+    path, sizes = dt.shard_dataset(make_data(103), tmp_path, 4)
+    assert path == os.path.join(tmp_path, "train@4")
+    assert sizes == [26, 26, 26, 25]
+    assert sorted(os.listdir(tmp_path)) == [f"train-{i:05d}-of-00004" for i in range(4)]
+
+
+def test_killed_server_restarts_on_same_address():
+    cluster = dt.local_cluster_spec(1)
+    address = cluster["worker"][0]
+    with dt.LocalCluster(cluster, max_restarts=1, poll_interval=0.2) as servers:
+        assert wait_for(lambda: is_listening(address))
+        first = servers.processes[("worker", 0)]
+        first.kill()
+        assert wait_for(lambda: servers.processes[("worker", 0)] is not first)
+        assert wait_for(lambda: is_listening(address))
+        assert servers.restarts[("worker", 0)] == 1
+        assert servers.cpu_seconds("worker", 0) > 0
+
+
+def test_train_distributed_localhost(tmp_path):
+    data = make_data(2000)
+    model, report = dt.train_distributed(data, num_workers=2, work_dir=str(tmp_path),
+                                         num_trees=20)
+    assert len(report["workers"]) == 2
+    assert sum(worker["assigned_rows"] for worker in report["workers"]) == len(data)
+    assert all(worker["restarts"] == 0 for worker in report["workers"])
+    assert all(worker["cpu_seconds"] > 0 for worker in report["workers"])
+    assert model.make_inspector().num_trees() == 20
+
+
+def kill_worker_during_training(servers, cache_dir, task_index, outcome):
+    """
+    Kill a worker once the training has started, i.e. once the workers write the dataset cache.
+    """
+    outcome["started"] = wait_for(
+        lambda: servers and cache_dir.exists() and any(cache_dir.iterdir()), timeout=300)
+    if outcome["started"]:
+        servers[0].processes[("worker", task_index)].kill()
+
+
+def test_train_distributed_survives_worker_kill(tmp_path):
+    data = make_data(50_000)
+    cluster = dt.local_cluster_spec(2)
+    outcome = {}
+    with dt.LocalCluster(cluster, max_restarts=2, poll_interval=0.2) as servers:
+        killer = threading.Thread(target=kill_worker_during_training,
+                                  args=([servers], tmp_path / "cache", 1, outcome), daemon=True)
+        killer.start()
+        model, _ = dt.train_distributed(data, cluster=cluster, work_dir=str(tmp_path),
+                                        num_trees=50)
+        killer.join()
+        assert outcome["started"]
+        assert wait_for(lambda: servers.restarts[("worker", 1)] == 1)
+    assert model.make_inspector().num_trees() > 0
+
+
+def test_server_failing_too_often_is_recorded():
+    cluster = dt.local_cluster_spec(1)
+    with dt.LocalCluster(cluster, max_restarts=0, poll_interval=0.2) as servers:
+        assert wait_for(lambda: is_listening(cluster["worker"][0]))
+        servers.processes[("worker", 0)].kill()
+        assert wait_for(lambda: servers.failures == [("worker", 0)])
+        assert ("worker", 0) not in servers.processes
+
+
+def test_fit_until_failure_does_not_wait_for_failed_server():
+    cluster = dt.local_cluster_spec(1)
+    blocked = threading.Event()
+    with dt.LocalCluster(cluster, max_restarts=0, poll_interval=0.2) as servers:
+        assert wait_for(lambda: is_listening(cluster["worker"][0]))
+        servers.processes[("worker", 0)].kill()
+        with pytest.raises(RuntimeError, match="worker:0"):
+            dt._fit_until_failure(blocked.wait, servers, poll_interval=0.2)
+
+
+def test_train_distributed_aborts_when_worker_fails_for_good(tmp_path, monkeypatch):
+    servers = []
+
+    class RecordingCluster(dt.LocalCluster):
+        def __enter__(self):
+            servers.append(self)
+            return super().__enter__()
+
+    monkeypatch.setattr(dt, "LocalCluster", RecordingCluster)
+    outcome = {}
+    killer = threading.Thread(target=kill_worker_during_training,
+                              args=(servers, tmp_path / "cache", 1, outcome), daemon=True)
+    killer.start()
+    with pytest.raises(RuntimeError, match="worker:1"):
+        dt.train_distributed(make_data(50_000), num_workers=2, work_dir=str(tmp_path),
+                             max_restarts=0, num_trees=50)
+    killer.join()
+    assert outcome["started"]
+
+
+@pytest.mark.skipif((os.cpu_count() or 1) < 4, reason="Needs at least 4 CPUs.")
+def test_train_distributed_scaling(tmp_path):
+    data = make_data(200_000, num_features=20)
+    seconds = {}
+    for num_workers in (1, 2, 4):
+        _, report = dt.train_distributed(data, num_workers=num_workers,
+                                         work_dir=str(tmp_path / str(num_workers)), num_trees=20)
+        seconds[num_workers] = report["seconds"]
+    # Loose bounds: the servers share the CPUs of a single host.
+    assert seconds[2] < seconds[1] * 1.1
+    assert seconds[4] < seconds[1]
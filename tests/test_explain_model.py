@@ -0,0 +1,83 @@
+"""
+Tests of the TreeSHAP contributions: for every row, the contributions and the expected value
+add up to the prediction of the model. They are skipped when TensorFlow Decision Forests is not
+installed.
+"""
+import sys
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pytest
+
+tfdf = pytest.importorskip("tensorflow_decision_forests")
+sys.path.append(str(Path(__file__).resolve().parents[1] / "src" / "models"))
+import explain_model as em  # noqa: E402  pylint: disable=wrong-import-position
+
+
+def make_data(num_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    data = pd.DataFrame({
+        "Id": np.arange(num_rows),
+        "LotArea": rng.normal(size=num_rows),
+        "YearBuilt": rng.integers(1900, 2010, size=num_rows),
+        "Neighborhood": rng.choice(["A", "B", "C", "D"], size=num_rows),
+    })
+    data.loc[rng.random(num_rows) < 0.1, "LotArea"] = np.nan
+    # Sparse categorical column, missing on most rows (as PoolQC).
+    data["PoolQC"] = np.where(rng.random(num_rows) < 0.05, "Ex", None)
+    # Categorical codes that look like numbers (as MSSubClass read as strings).
+    data["SubClass"] = rng.choice(["20", "60", "90"], size=num_rows)
+    data["SalePrice"] = (2 * data["LotArea"].fillna(0) + (data["YearBuilt"] - 1950) / 20
+                         + data["Neighborhood"].map({"A": 0, "B": 1, "C": 3, "D": -1})
+                         + 3 * data["PoolQC"].notna() + 2 * (data["SubClass"] == "60")
+                         + rng.normal(scale=0.1, size=num_rows))
+    return data
+
+
+def predict(model, features):
+    dataset = tfdf.keras.pd_dataframe_to_tf_dataset(features, task=tfdf.keras.Task.REGRESSION)
+    return np.asarray(model.predict(dataset, verbose=0)).reshape(-1)
+
+
+@pytest.fixture(scope="module", params=["GradientBoostedTreesModel", "RandomForestModel"])
+def model(request):
+    train = make_data(1000).drop("Id", axis=1)
+    model = getattr(tfdf.keras, request.param)(task=tfdf.keras.Task.REGRESSION, num_trees=30,
+                                               max_depth=5, verbose=0)
+    model.fit(tfdf.keras.pd_dataframe_to_tf_dataset(train, label="SalePrice",
+                                                    task=tfdf.keras.Task.REGRESSION))
+    return model
+
+
+def test_contributions_add_up_to_predictions(model):
+    features = make_data(300, seed=1).drop(["Id", "SalePrice"], axis=1)
+    contributions = em.tree_shap(model, features, n_jobs=2, chunk_size=64)
+    np.testing.assert_allclose(contributions.sum(axis=1), predict(model, features),
+                               rtol=1e-4, atol=1e-4)
+
+
+def test_save_contributions_reads_categorical_columns_as_strings(model, tmp_path):
+    data = make_data(300, seed=2).drop("SalePrice", axis=1)
+    data.loc[:99, "PoolQC"] = None
+    data.loc[100:199:2, "SubClass"] = None
+    data.to_csv(tmp_path / "data.csv", index=False)
+    em.save_contributions(model, tmp_path / "data.csv", tmp_path / "output.csv", chunksize=100)
+
+    output = pd.read_csv(tmp_path / "output.csv")
+    expected = predict(model, data.drop("Id", axis=1))
+    np.testing.assert_allclose(output["Predicted_Value"], expected, rtol=1e-4, atol=1e-4)
+    contributions = output.filter(like="Contribution_").sum(axis=1)
+    np.testing.assert_allclose(contributions, expected, rtol=1e-4, atol=1e-4)
+
+
+def test_main_with_saved_model(model, tmp_path):
+    data = make_data(200, seed=3).drop("SalePrice", axis=1)
+    data.to_csv(tmp_path / "data.csv", index=False)
+    model.save(str(tmp_path / "model"))
+    em.main(str(tmp_path / "model"), tmp_path / "data.csv", tmp_path / "output.csv")
+
+    output = pd.read_csv(tmp_path / "output.csv")
+    expected = predict(model, data.drop("Id", axis=1))
+    np.testing.assert_allclose(output["Predicted_Value"], expected, rtol=1e-4, atol=1e-4)
+    contributions = output.filter(like="Contribution_").sum(axis=1)
+    np.testing.assert_allclose(contributions, expected, rtol=1e-4, atol=1e-4)
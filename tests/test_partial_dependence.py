@@ -0,0 +1,56 @@
+"""
+Tests of the partial dependence computation. They are skipped when TensorFlow Decision Forests
+is not installed.
+"""
+import sys
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pytest
+
+tfdf = pytest.importorskip("tensorflow_decision_forests")
+sys.path.append(str(Path(__file__).resolve().parents[1] / "src" / "models"))
+import partial_dependence as pdp  # noqa: E402  pylint: disable=wrong-import-position
+
+
+def make_data(num_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    data = pd.DataFrame({"LotArea": rng.normal(size=num_rows),
+                         "YearBuilt": rng.integers(1900, 2010, size=num_rows)})
+    data["SalePrice"] = 2 * data["LotArea"] + (data["YearBuilt"] - 1950) / 20
+    return data
+
+
+@pytest.fixture(scope="module")
+def model():
+    model = tfdf.keras.GradientBoostedTreesModel(task=tfdf.keras.Task.REGRESSION, num_trees=20,
+                                                 verbose=0)
+    model.fit(tfdf.keras.pd_dataframe_to_tf_dataset(make_data(500), label="SalePrice",
+                                                    task=tfdf.keras.Task.REGRESSION))
+    return model
+
+
+def test_cross_product_with_non_unique_index():
+    rows = pd.DataFrame({"a": [1, 2, 3], "b": ["x", "y", "z"]}, index=[0, 0, 1])
+    product = pdp.cross_product(rows, "a", [10, 20])
+    assert product["b"].tolist() == ["x", "x", "y", "y", "z", "z"]
+    assert product["a"].tolist() == [10, 20] * 3
+
+
+def test_partial_dependence_with_non_unique_index(model):
+    data = make_data(100, seed=1).drop("SalePrice", axis=1)
+    data = pd.concat([data, data.iloc[:20]])
+    ice = pdp.partial_dependence(model, data, "LotArea", num_points=5)
+    assert ice.shape == (len(data), 5)
+
+
+def test_cache_depends_on_data(model):
+    pdp.clear_cache()
+    first = make_data(100, seed=2).drop("SalePrice", axis=1)
+    second = first.assign(YearBuilt=1900)
+    grid = [-1.0, 0.0, 1.0]
+    ice_first = pdp.partial_dependence(model, first, "LotArea", grid=grid, model_key="gbt")
+    ice_second = pdp.partial_dependence(model, second, "LotArea", grid=grid, model_key="gbt")
+    assert not np.allclose(ice_first.mean().to_numpy(), ice_second.mean().to_numpy())
+    cached = pdp.partial_dependence(model, first, "LotArea", grid=grid, model_key="gbt")
+    pd.testing.assert_frame_equal(cached, ice_first)